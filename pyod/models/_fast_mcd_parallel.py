@@ -0,0 +1,1183 @@
+# -*- coding: utf-8 -*-
+"""FastMCD with a parallel trial loop.
+
+Adapted from sklearn/covariance/_robust_covariance.py (BSD 3 clause).
+The random starts of each trial are drawn serially from ``random_state``
+before the C-step chains are dispatched, so the result does not depend on
+``n_jobs`` and matches the serial scikit-learn implementation.
+"""
+# The FastMCD code adapted from scikit-learn:
+#
+# Author: Virgile Fritsch <virgile.fritsch@inria.fr>
+#
+# Copyright (c) 2007-2024 The scikit-learn developers.
+# All rights reserved.
+#
+# License: BSD 3 clause
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+#
+# * Redistributions of source code must retain the above copyright notice,
+#   this list of conditions and the following disclaimer.
+#
+# * Redistributions in binary form must reproduce the above copyright
+#   notice, this list of conditions and the following disclaimer in the
+#   documentation and/or other materials provided with the distribution.
+#
+# * Neither the name of the copyright holder nor the names of its
+#   contributors may be used to endorse or promote products derived from
+#   this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS
+# IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO,
+# THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR
+# CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+# EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR
+# PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+# LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+# NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+import warnings
+from bisect import insort
+from contextlib import nullcontext
+from functools import partial
+from numbers import Integral
+
+import numpy as np
+from joblib import Parallel, delayed, effective_n_jobs
+from scipy import linalg
+from scipy.linalg.blas import get_blas_funcs
+from scipy.linalg.lapack import get_lapack_funcs
+from sklearn.covariance import MinCovDet
+from sklearn.covariance import empirical_covariance
+from sklearn.utils import check_random_state
+from sklearn.utils.extmath import fast_logdet
+from sklearn.utils.validation import FLOAT_DTYPES
+from sklearn.utils.validation import check_array
+
+from ._mcd_numba import _cov_of_subset
+from ._mcd_numba import _mahalanobis_all
+from ._mcd_numba import _partial_argsort_h
+
+# up to this dimension the C-step kernels are compiled by numba, above it
+# the BLAS calls of numpy are faster: on 500 to 5000 samples both the
+# covariance and the distance kernel cross over between 8 and 10 features
+_NUMBA_MAX_FEATURES = 8
+
+
+def _inv_cholesky(covariance):
+    """Invert a symmetric positive definite matrix through its Cholesky
+    factorization, falling back to the pseudo inverse when the matrix is
+    not positive definite.
+
+    Parameters
+    ----------
+    covariance : numpy array of shape (n_features, n_features)
+        The covariance matrix.
+
+    Returns
+    -------
+    precision : numpy array of shape (n_features, n_features)
+        The inverse of the covariance matrix.
+    """
+    potrf, potri = get_lapack_funcs(('potrf', 'potri'), (covariance,))
+    # LAPACK works on blocks of the triangular factor, so the inversion
+    # runs as matrix-matrix products instead of an eigendecomposition
+    chol, info = potrf(covariance, lower=1, clean=0)
+    if info != 0:
+        return linalg.pinvh(covariance, check_finite=False)
+    precision, info = potri(chol, lower=1)
+    if info != 0:
+        return linalg.pinvh(covariance, check_finite=False)
+    # only the lower triangle is computed
+    return np.tril(precision) + np.tril(precision, -1).T
+
+
+def _batch_precisions(covariances):
+    """Invert a stack of covariance matrices from one batched Cholesky
+    factorization, falling back to the pseudo inverses when any of them is
+    not positive definite.
+
+    Parameters
+    ----------
+    covariances : numpy array of shape (n_candidates, n_features, n_features)
+        The stacked covariance matrices.
+
+    Returns
+    -------
+    precisions : numpy array of shape (n_candidates, n_features, n_features)
+        The inverses of the covariance matrices.
+    """
+    # numpy loops over the stack inside a single gufunc call, which saves
+    # the per-matrix dispatch of scipy at small n_features
+    try:
+        inv_chol = np.linalg.inv(np.linalg.cholesky(covariances))
+    except np.linalg.LinAlgError:
+        return np.array([linalg.pinvh(covariance)
+                         for covariance in covariances])
+    return np.matmul(np.swapaxes(inv_chol, 1, 2), inv_chol)
+
+
+def _distances(X, location, precision):
+    """Squared Mahalanobis distances of the samples in a C-step."""
+    if X.shape[1] <= _NUMBA_MAX_FEATURES:
+        return _mahalanobis_all(X, location, precision)
+    X_centered = X - location
+    return (np.dot(X_centered, precision) * X_centered).sum(axis=1)
+
+
+def _h_subset(dist, n_support):
+    """Mask of the ``n_support`` samples with the smallest distances.
+
+    Any h-subset of the smallest distances is a valid C-step support and
+    its estimates do not depend on the order of the samples, so a partial
+    sort in O(n_samples) replaces the full O(n_samples log n_samples) one.
+    """
+    support = np.zeros(dist.shape[0], dtype=bool)
+    support[_partial_argsort_h(dist, n_support)] = True
+    return support
+
+
+def _estimates(X, support):
+    """Location and empirical covariance of the support in a C-step."""
+    if X.shape[1] <= _NUMBA_MAX_FEATURES:
+        return _cov_of_subset(X, np.flatnonzero(support))
+    # a float copy, centered in place below
+    X_support = np.ascontiguousarray(X[support], dtype=np.float64)
+    location = X_support.mean(axis=0)
+    X_support -= location
+    # rank-h update of the upper triangle: the transpose of the centered
+    # support is Fortran ordered, so BLAS streams it row by row in place
+    syrk = get_blas_funcs('syrk', (X_support,))
+    covariance = syrk(1. / X_support.shape[0], X_support.T, lower=0)
+    return location, np.triu(covariance) + np.triu(covariance, 1).T
+
+
+def _update_estimates(X, support, new_support, sums):
+    """Location and empirical covariance of ``new_support`` obtained by
+    updating the running sums of ``support`` with the samples that left
+    and joined it.
+
+    Successive supports of a chain mostly overlap near convergence, so the
+    update costs O(|added| p^2) instead of O(n_support p^2). When more than
+    half of the support changes, the estimates are recomputed in full.
+
+    Parameters
+    ----------
+    X : numpy array of shape (n_samples, n_features)
+        The input samples.
+
+    support : numpy array of shape (n_samples,)
+        Boolean mask of the current support.
+
+    new_support : numpy array of shape (n_samples,)
+        Boolean mask of the next support, of the same size.
+
+    sums : tuple of (shift, sum, sum_of_squares)
+        The sum and the sum of outer products of the samples of
+        ``support`` minus ``shift``, the location of the last full
+        computation, which keeps the sums small and the update accurate.
+
+    Returns
+    -------
+    location, covariance, sums : tuple
+        The estimates of ``new_support`` and its running sums.
+    """
+    n_support = np.count_nonzero(new_support)
+    added = np.flatnonzero(new_support & ~support)
+    if 2 * added.shape[0] > n_support:
+        location, covariance = _estimates(X, new_support)
+        sums = (location, np.zeros_like(location), n_support * covariance)
+        return location, covariance, sums
+
+    shift, sum_, sum_squares = sums
+    X_added = X[added] - shift
+    X_removed = X[np.flatnonzero(support & ~new_support)] - shift
+    sum_ = sum_ + X_added.sum(axis=0) - X_removed.sum(axis=0)
+    sum_squares = (sum_squares + np.dot(X_added.T, X_added) -
+                   np.dot(X_removed.T, X_removed))
+    mean = sum_ / n_support
+    covariance = sum_squares / n_support - np.outer(mean, mean)
+    return shift + mean, covariance, (shift, sum_, sum_squares)
+
+
+def _c_step(X, n_support, initial_support=None, initial_estimates=None,
+            initial_precision=None, remaining_iterations=30):
+    """Run one chain of C-steps, see :cite:`rousseeuw1999fast`.
+
+    Parameters
+    ----------
+    X : numpy array of shape (n_samples, n_features)
+        Data set in which we look for the n_support observations whose
+        scatter matrix has minimum determinant.
+
+    n_support : int
+        Number of observations to compute the robust estimates from.
+
+    initial_support : numpy array of shape (n_samples,), optional
+        Boolean mask of the random initial support.
+
+    initial_estimates : tuple of (location, covariance), optional
+        Initial estimates the chain starts from. Used when
+        ``initial_support`` is None.
+
+    initial_precision : numpy array of shape (n_features, n_features), \
+            optional
+        The inverse of the initial covariance, if already computed.
+
+    remaining_iterations : int, optional (default=30)
+        Maximum number of C-steps to perform.
+
+    Returns
+    -------
+    location, covariance, det, support, dist : tuple
+        The estimates of the best h-subset found by the chain.
+    """
+    n_samples, n_features = X.shape
+    dist = np.inf
+
+    if initial_estimates is None:
+        support = initial_support
+    else:
+        location, covariance = initial_estimates
+        # run a special iteration for that case (to get an initial support)
+        precision = initial_precision
+        if precision is None:
+            precision = linalg.pinvh(covariance)
+        X_centered = X - location
+        dist = (np.dot(X_centered, precision) * X_centered).sum(1)
+        support = _h_subset(dist, n_support)
+
+    location, covariance = _estimates(X, support)
+    sums = (location, np.zeros_like(location), n_support * covariance)
+
+    det = fast_logdet(covariance)
+    # the data already has singular covariance: the loop is not entered
+    if np.isinf(det):
+        precision = linalg.pinvh(covariance)
+
+    previous_det = np.inf
+    while (det < previous_det and remaining_iterations > 0
+           and not np.isinf(det)):
+        previous_location = location
+        previous_covariance = covariance
+        previous_det = det
+        previous_support = support
+        # compute a new support from the full data set distances
+        precision = linalg.pinvh(covariance)
+        dist = _distances(X, location, precision)
+        support = _h_subset(dist, n_support)
+        location, covariance, sums = _update_estimates(
+            X, previous_support, support, sums)
+        det = fast_logdet(covariance)
+        remaining_iterations -= 1
+
+    previous_dist = dist
+    dist = _distances(X, location, precision)
+    # best fit already found (det => 0, logdet => -inf)
+    if np.isinf(det):
+        results = location, covariance, det, support, dist
+    if np.allclose(det, previous_det):
+        results = location, covariance, det, support, dist
+    elif det > previous_det:
+        warnings.warn(
+            "Determinant has increased; this should not happen: "
+            "log(det) > log(previous_det) (%.15f > %.15f). "
+            "You may want to try with a higher value of "
+            "support_fraction (current value: %.3f)."
+            % (det, previous_det, n_support / n_samples),
+            RuntimeWarning)
+        results = (previous_location, previous_covariance, previous_det,
+                   previous_support, previous_dist)
+
+    if remaining_iterations == 0:
+        results = location, covariance, det, support, dist
+
+    return results
+
+
+def _shrunk_covariance(X, shrinkage, assume_centered=False):
+    """Empirical covariance with ``shrinkage`` added to its diagonal."""
+    covariance = empirical_covariance(X, assume_centered=assume_centered)
+    covariance.flat[::covariance.shape[0] + 1] += shrinkage
+    return covariance
+
+
+def _dual_estimates(X, support, shrinkage):
+    """Location and factored shrunk covariance of the support.
+
+    Returns the location m, A = (X[support] - m) / sqrt(h) such that the
+    empirical covariance is S = A^T A, the lower Cholesky factor of the
+    h x h matrix A A^T + shrinkage * I and log det(S + shrinkage * I),
+    obtained by Sylvester's determinant identity.
+    """
+    X_support = X[support]
+    location = X_support.mean(axis=0)
+    A = (X_support - location) / np.sqrt(X_support.shape[0])
+    chol, det = _dual_factor(A, shrinkage)
+    return location, A, chol, det
+
+
+def _dual_factor(A, shrinkage):
+    """Lower Cholesky factor of A A^T + shrinkage * I and the log
+    determinant of A^T A + shrinkage * I, see :func:`_dual_estimates`."""
+    n_support, n_features = A.shape
+    gram = np.dot(A, A.T)
+    gram.flat[::n_support + 1] += shrinkage
+    chol = linalg.cholesky(gram, lower=True)
+    det = ((n_features - n_support) * np.log(shrinkage) +
+           2 * np.log(np.diag(chol)).sum())
+    return chol, det
+
+
+def _dual_covariance(A, shrinkage):
+    """The shrunk covariance A^T A + shrinkage * I of the factor A of a
+    dual C-step chain."""
+    covariance = np.dot(A.T, A)
+    covariance.flat[::A.shape[1] + 1] += shrinkage
+    return covariance
+
+
+def _dual_distances(X, location, A, chol, shrinkage):
+    """Squared Mahalanobis distances w.r.t. S + shrinkage * I by the
+    Woodbury identity, without forming the n_features x n_features
+    matrices."""
+    X_centered = X - location
+    B = linalg.solve_triangular(chol, np.dot(A, X_centered.T), lower=True)
+    return (np.einsum('ij,ij->i', X_centered, X_centered) -
+            np.einsum('ij,ij->j', B, B)) / shrinkage
+
+
+def _c_step_dual(X, n_support, shrinkage, initial_support=None,
+                 initial_estimates=None, remaining_iterations=30):
+    """Run one chain of C-steps on the shrunk covariance
+    S + shrinkage * I when n_support < n_features.
+
+    The determinant and the distances only involve the n_support x
+    n_support Gram matrix of the centered support, see
+    :func:`_dual_estimates` and :func:`_dual_distances`, which brings the
+    cost of a C-step from O(p^3) down to O(n h p). The covariance of the
+    chain is not formed: the chain returns its factor A, with the shrunk
+    covariance A^T A + shrinkage * I.
+
+    Parameters
+    ----------
+    X : numpy array of shape (n_samples, n_features)
+        Data set in which we look for the n_support observations whose
+        scatter matrix has minimum determinant.
+
+    n_support : int
+        Number of observations to compute the robust estimates from.
+
+    shrinkage : float
+        The positive value added to the diagonal of the covariance.
+
+    initial_support : numpy array of shape (n_samples,), optional
+        Boolean mask of the random initial support.
+
+    initial_estimates : tuple of (location, A), optional
+        Initial location and covariance factor, e.g., of a chain on
+        another subset, the chain starts from. Used when
+        ``initial_support`` is None.
+
+    remaining_iterations : int, optional (default=30)
+        Maximum number of C-steps to perform.
+
+    Returns
+    -------
+    location, A, det, support, dist : tuple
+        The estimates of the best h-subset found by the chain, where A is
+        the factor of its covariance.
+    """
+    n_samples = X.shape[0]
+
+    if initial_estimates is None:
+        support = initial_support
+    else:
+        location, A = initial_estimates
+        chol, _ = _dual_factor(A, shrinkage)
+        support = _h_subset(
+            _dual_distances(X, location, A, chol, shrinkage), n_support)
+
+    location, A, chol, det = _dual_estimates(X, support, shrinkage)
+    dist = np.inf
+
+    previous_det = np.inf
+    while det < previous_det and remaining_iterations > 0:
+        previous_location = location
+        previous_A = A
+        previous_det = det
+        previous_support = support
+        dist = _dual_distances(X, location, A, chol, shrinkage)
+        support = _h_subset(dist, n_support)
+        location, A, chol, det = _dual_estimates(X, support, shrinkage)
+        remaining_iterations -= 1
+
+    previous_dist = dist
+    dist = _dual_distances(X, location, A, chol, shrinkage)
+    if np.allclose(det, previous_det):
+        results = location, A, det, support, dist
+    elif det > previous_det:
+        warnings.warn(
+            "Determinant has increased; this should not happen: "
+            "log(det) > log(previous_det) (%.15f > %.15f). "
+            "You may want to try with a higher value of "
+            "support_fraction (current value: %.3f)."
+            % (det, previous_det, n_support / n_samples),
+            RuntimeWarning)
+        results = (previous_location, previous_A, previous_det,
+                   previous_support, previous_dist)
+
+    if remaining_iterations == 0:
+        results = location, A, det, support, dist
+
+    return results
+
+
+def _array_module(device):
+    """Array module of ``device``: numpy for 'cpu', cupy for 'cuda'."""
+    if device == 'cpu':
+        return np
+    try:
+        import cupy
+    except ImportError:
+        raise ImportError(
+            "Please install cupy if you wish to use device='cuda'")
+    return cupy
+
+
+def _device_precision(covariance, xp):
+    """Precision and log-determinant of a covariance matrix on the device
+    of the array module ``xp``, from its Cholesky factor. Singular matrices
+    get the pseudo inverse and a log-determinant of -inf."""
+    try:
+        chol = xp.linalg.cholesky(covariance)
+        det = 2. * float(xp.log(xp.diagonal(chol)).sum())
+    except np.linalg.LinAlgError:
+        det = np.nan
+    if not np.isfinite(det):
+        # cupy flags a failed factorization with nan instead of raising
+        return xp.linalg.pinv(covariance), -np.inf
+    inv_chol = xp.linalg.inv(chol)
+    return xp.dot(inv_chol.T, inv_chol), det
+
+
+def _c_step_device(X, n_support, xp, initial_support=None,
+                   initial_estimates=None, initial_precision=None,
+                   remaining_iterations=30):
+    """Run one chain of C-steps with the array module ``xp``, e.g., cupy to
+    keep the chain on the GPU, see :func:`_c_step`.
+
+    X lives on the device and is only read; the estimates of the chain are
+    copied back to the host when it ends.
+
+    Parameters
+    ----------
+    X : array of shape (n_samples, n_features) of the module ``xp``
+        Data set in which we look for the n_support observations whose
+        scatter matrix has minimum determinant.
+
+    n_support : int
+        Number of observations to compute the robust estimates from.
+
+    xp : module
+        The array module, numpy or cupy.
+
+    initial_support : numpy array of shape (n_samples,), optional
+        Boolean mask of the random initial support.
+
+    initial_estimates : tuple of (location, covariance), optional
+        Initial estimates the chain starts from. Used when
+        ``initial_support`` is None.
+
+    initial_precision : numpy array of shape (n_features, n_features), \
+            optional
+        The inverse of the initial covariance, if already computed.
+
+    remaining_iterations : int, optional (default=30)
+        Maximum number of C-steps to perform.
+
+    Returns
+    -------
+    location, covariance, det, support, dist : tuple
+        The estimates of the best h-subset found by the chain, as numpy
+        arrays.
+    """
+    n_samples = X.shape[0]
+    to_host = getattr(xp, 'asnumpy', np.asarray)
+
+    def distances(location, precision):
+        X_centered = X - location
+        return (xp.dot(X_centered, precision) * X_centered).sum(axis=1)
+
+    def h_subset(location, precision):
+        dist = distances(location, precision)
+        return xp.argpartition(dist, n_support - 1)[:n_support]
+
+    def estimates(index):
+        X_support = X[index]
+        location = X_support.mean(axis=0)
+        X_support = X_support - location
+        return location, xp.dot(X_support.T, X_support) / n_support
+
+    if initial_estimates is None:
+        index = xp.asarray(np.flatnonzero(initial_support))
+    else:
+        location = xp.asarray(initial_estimates[0])
+        if initial_precision is None:
+            precision, _ = _device_precision(
+                xp.asarray(initial_estimates[1]), xp)
+        else:
+            precision = xp.asarray(initial_precision)
+        index = h_subset(location, precision)
+
+    location, covariance = estimates(index)
+    precision, det = _device_precision(covariance, xp)
+    # the final distances use the precision of the last but one estimates,
+    # as in _c_step
+    dist_precision = precision
+
+    dist = None
+    previous_det = np.inf
+    while (det < previous_det and remaining_iterations > 0
+           and not np.isinf(det)):
+        previous_location = location
+        previous_covariance = covariance
+        previous_det = det
+        previous_index = index
+        dist_precision = precision
+        dist = distances(location, precision)
+        index = xp.argpartition(dist, n_support - 1)[:n_support]
+        location, covariance = estimates(index)
+        precision, det = _device_precision(covariance, xp)
+        remaining_iterations -= 1
+
+    previous_dist = dist
+    dist = distances(location, dist_precision)
+    results = location, covariance, det, index, dist
+    if not (np.isinf(det) or np.allclose(det, previous_det)) \
+            and det > previous_det:
+        warnings.warn(
+            "Determinant has increased; this should not happen: "
+            "log(det) > log(previous_det) (%.15f > %.15f). "
+            "You may want to try with a higher value of "
+            "support_fraction (current value: %.3f)."
+            % (det, previous_det, n_support / n_samples),
+            RuntimeWarning)
+        results = (previous_location, previous_covariance, previous_det,
+                   previous_index, previous_dist)
+    if remaining_iterations == 0:
+        results = location, covariance, det, index, dist
+
+    location, covariance, det, index, dist = results
+    support = np.zeros(n_samples, dtype=bool)
+    support[to_host(index)] = True
+    return to_host(location), to_host(covariance), det, support, \
+        to_host(dist)
+
+
+def _is_dual(n_support, n_features, shrinkage):
+    """Whether the C-steps run on the dual problem, see
+    :func:`_c_step_dual`."""
+    return shrinkage is not None and n_support < n_features
+
+
+def _run_chains(c_step, X, n_support, n_iter, starts, parallel=None):
+    """Run the C-step chains from ``starts``, in the threads of the
+    :class:`joblib.Parallel` instance ``parallel`` if given."""
+    if parallel is None:
+        return [c_step(X, n_support, remaining_iterations=n_iter, **start)
+                for start in starts]
+    return parallel(
+        delayed(c_step)(X, n_support, remaining_iterations=n_iter, **start)
+        for start in starts)
+
+
+def _select_candidates(X, n_support, n_trials, random_state, select=1,
+                       n_iter=30, n_jobs=None, shrinkage=None, patience=None,
+                       device='cpu', factored=False):
+    """Find the ``select`` best h-subsets over ``n_trials`` C-step chains.
+
+    Parameters
+    ----------
+    X : numpy array of shape (n_samples, n_features)
+        Data (sub)set in which we look for the n_support purest observations.
+
+    n_support : int
+        The number of samples the pure data set must contain.
+
+    n_trials : int or tuple of (locations, covariances)
+        Number of random initial supports, or the initial estimates the
+        chains start from.
+
+    random_state : RandomState instance
+        The random number generator for the initial supports.
+
+    select : int, optional (default=1)
+        Number of best candidates to return.
+
+    n_iter : int, optional (default=30)
+        Maximum number of C-steps per chain.
+
+    n_jobs : int, optional (default=None)
+        The number of threads running the chains.
+
+    shrinkage : float, optional (default=None)
+        If given and n_support < n_features, the chains minimize the
+        determinant of the covariance shrunk by ``shrinkage`` times the
+        identity, see :func:`_c_step_dual`.
+
+    patience : int, optional (default=None)
+        If given, the random starts stop once the ``select``-th lowest
+        determinant has not decreased over ``patience`` trials.
+
+    device : {'cpu', 'cuda'}, optional (default='cpu')
+        With 'cuda', X is copied to the GPU once and the chains run there
+        one after the other, see :func:`_c_step_device`. The dual C-step
+        of ``shrinkage`` stays on the CPU.
+
+    factored : bool, optional (default=False)
+        Whether the covariances of the ``n_trials`` candidates are the
+        factors A returned by :func:`_c_step_dual`. The candidates of dual
+        chains must be factored.
+
+    Returns
+    -------
+    best_locations, best_covariances, best_supports, best_ds : tuple
+        The estimates of the ``select`` lowest determinant chains. For
+        dual chains, best_covariances holds their factors A, of shape
+        (select, n_support, n_features).
+    """
+    n_samples, n_features = X.shape
+    dual = _is_dual(n_support, n_features, shrinkage)
+
+    if isinstance(n_trials, Integral):
+        # draw the random starts serially to keep them independent of n_jobs
+        starts = []
+        for _ in range(n_trials):
+            support = np.zeros(n_samples, dtype=bool)
+            support[random_state.permutation(n_samples)[:n_support]] = True
+            starts.append({'initial_support': support})
+    elif isinstance(n_trials, tuple) and dual:
+        # the dual chains start from the factors, without forming any
+        # n_features x n_features matrix
+        locations, factors = n_trials
+        starts = [{'initial_estimates': (locations[j], factors[j])}
+                  for j in range(locations.shape[0])]
+    elif isinstance(n_trials, tuple):
+        locations, covariances = n_trials
+        if factored:
+            covariances = np.asarray(
+                [_dual_covariance(A, shrinkage) for A in covariances])
+        # invert the candidate covariances in one batch, not chain by chain
+        precisions = _batch_precisions(covariances)
+        starts = [{'initial_estimates': (locations[j], covariances[j]),
+                   'initial_precision': precisions[j]}
+                  for j in range(locations.shape[0])]
+    else:
+        raise TypeError("Invalid 'n_trials' parameter, expected tuple or "
+                        "integer, got %s (%s)" % (n_trials, type(n_trials)))
+
+    X_chains = X
+    if dual:
+        c_step = partial(_c_step_dual, shrinkage=shrinkage)
+    elif device == 'cuda':
+        xp = _array_module(device)
+        X_chains = xp.asarray(X)
+        c_step = partial(_c_step_device, xp=xp)
+    else:
+        c_step = _c_step
+
+    parallel = None
+    if effective_n_jobs(n_jobs) > 1 and X_chains is X:
+        parallel = Parallel(n_jobs=n_jobs, prefer='threads')
+
+    if patience is None or isinstance(n_trials, tuple):
+        all_estimates = _run_chains(c_step, X_chains, n_support, n_iter,
+                                    starts, parallel)
+    else:
+        # run the random starts by batches and stop once the select-th
+        # lowest determinant has not decreased over `patience` trials; the
+        # chains are checked in order, so the trials kept do not depend on
+        # n_jobs. The threads get `patience` chains per batch to keep the
+        # dispatch overhead low.
+        batch_size = 1 if parallel is None else max(
+            patience, effective_n_jobs(n_jobs))
+        all_estimates = []
+        best_dets = []
+        last_improvement = 0
+        with (parallel or nullcontext()):
+            for begin in range(0, len(starts), batch_size):
+                estimates = _run_chains(c_step, X_chains, n_support,
+                                        n_iter,
+                                        starts[begin:begin + batch_size],
+                                        parallel)
+                for estimate in estimates:
+                    trial = len(all_estimates)
+                    if (len(best_dets) >= select and
+                            trial - last_improvement > patience):
+                        break
+                    all_estimates.append(estimate)
+                    det = estimate[2]
+                    if (len(best_dets) < select or
+                            det < best_dets[-1] - 1e-10):
+                        insort(best_dets, det)
+                        del best_dets[select:]
+                        last_improvement = trial
+                if len(all_estimates) < begin + len(estimates):
+                    break
+
+    all_locs, all_covs, all_dets, all_supports, all_ds = zip(*all_estimates)
+    index_best = np.argsort(all_dets)[:select]
+    best_locations = np.asarray(all_locs)[index_best]
+    best_covariances = np.asarray(all_covs)[index_best]
+    best_supports = np.asarray(all_supports)[index_best]
+    best_ds = np.asarray(all_ds)[index_best]
+
+    return best_locations, best_covariances, best_supports, best_ds
+
+
+def fast_mcd(X, support_fraction=None, random_state=None, n_jobs=None,
+             shrinkage=None, n_trials=500, patience=None, device='cpu',
+             warm_support=None):
+    """Estimate the raw Minimum Covariance Determinant with FastMCD.
+
+    Parameters
+    ----------
+    X : numpy array of shape (n_samples, n_features)
+        The input samples.
+
+    support_fraction : float, optional (default=None)
+        The proportion of points to be included in the support of the raw
+        MCD estimate. None implies (n_samples + n_features + 1) / 2.
+
+    random_state : int, RandomState instance or None, optional (default=None)
+        The random number generator for the subsets and initial supports.
+
+    n_jobs : int, optional (default=None)
+        The number of threads running the trial loop once the data set is
+        split into subsets (n_samples > 500).
+
+    shrinkage : float, optional (default=None)
+        If given and the support is smaller than n_features, the C-steps
+        minimize the determinant of the covariance plus ``shrinkage`` times
+        the identity, computed on the n_support x n_support dual problem.
+        Without ``support_fraction``, a default support covering the whole
+        data set is reduced to 3/4 of the samples; smaller defaults are
+        kept.
+
+    n_trials : int, optional (default=500)
+        The total number of random starts over the subsets
+        (n_samples > 500).
+
+    patience : int, optional (default=None)
+        If given, the random starts of a subset stop once its 10 lowest
+        determinants have not decreased over ``patience`` trials.
+
+    device : {'cpu', 'cuda'}, optional (default='cpu')
+        The device running the C-step chains, see :func:`_select_candidates`.
+
+    warm_support : numpy array of shape (n_samples,), optional
+        Boolean mask of the support of a previous fit. If it has n_support
+        samples, a single C-step chain runs from its estimates on X in
+        place of the random trials.
+
+    Returns
+    -------
+    location, covariance, support, dist : tuple
+        The raw robust estimates and the distances of the samples.
+    """
+    random_state = check_random_state(random_state)
+
+    X = check_array(X, ensure_min_samples=2, estimator="fast_mcd",
+                    dtype=FLOAT_DTYPES)
+    n_samples, n_features = X.shape
+
+    # minimum breakdown value
+    if support_fraction is None:
+        n_support = int(np.ceil(0.5 * (n_samples + n_features + 1)))
+        if shrinkage is not None and n_support >= n_samples:
+            # with n_features >= n_samples - 1 the above is the whole data
+            # set; the shrunk covariance is regular for any support, so
+            # keep 3/4 of the samples, as the regularized MCD does
+            n_support = int(np.ceil(0.75 * n_samples))
+    else:
+        n_support = int(support_fraction * n_samples)
+    dual = _is_dual(n_support, n_features, shrinkage)
+
+    # 1-dimensional case quick computation
+    if n_features == 1:
+        if n_support < n_samples:
+            # find the sample shortest halves
+            X_sorted = np.sort(np.ravel(X))
+            diff = X_sorted[n_support:] - X_sorted[:(n_samples - n_support)]
+            halves_start = np.where(diff == np.min(diff))[0]
+            # take the middle points' mean to get the robust location
+            location = 0.5 * (X_sorted[n_support + halves_start] +
+                              X_sorted[halves_start]).mean()
+            X_centered = X - location
+            support = _h_subset(np.abs(X_centered[:, 0]), n_support)
+            covariance = np.asarray([[np.var(X[support])]])
+            location = np.array([location])
+        else:
+            support = np.ones(n_samples, dtype=bool)
+            covariance = np.asarray([[np.var(X)]])
+            location = np.asarray([np.mean(X)])
+            X_centered = X - location
+        precision = linalg.pinvh(covariance)
+        dist = (np.dot(X_centered, precision) * X_centered).sum(axis=1)
+
+    if (n_support >= n_samples) and (n_features > 1):
+        # the support is the whole data set: every C-step chain converges
+        # to the empirical estimates, so skip the trials
+        support = np.ones(n_samples, dtype=bool)
+        location = X.mean(axis=0)
+        covariance = empirical_covariance(X)
+        if shrinkage is not None and n_samples < n_features:
+            covariance.flat[::n_features + 1] += shrinkage
+        precision = linalg.pinvh(covariance)
+        X_centered = X - location
+        dist = (np.dot(X_centered, precision) * X_centered).sum(axis=1)
+
+    elif (warm_support is not None and n_features > 1 and
+          warm_support.shape == (n_samples,) and
+          warm_support.sum() == n_support):
+        # the previous support is close to the minimum on slowly drifting
+        # data: run the C-steps from it until the determinant converges
+        if dual:
+            location, covariance = _dual_estimates(
+                X, warm_support, shrinkage)[:2]
+        else:
+            location, covariance = _estimates(X, warm_support)
+        locations, covariances, supports, d = _select_candidates(
+            X, n_support, (location[np.newaxis], covariance[np.newaxis]),
+            random_state, n_jobs=n_jobs, shrinkage=shrinkage, device=device,
+            factored=dual)
+        location = locations[0]
+        covariance = covariances[0]
+        if dual:
+            covariance = _dual_covariance(covariance, shrinkage)
+        support = supports[0]
+        dist = d[0]
+
+    elif (n_samples > 500) and (n_features > 1):
+        # 1. find candidate supports on subsets of size ~ 300
+        n_subsets = n_samples // 300
+        n_samples_subsets = n_samples // n_subsets
+        samples_shuffle = random_state.permutation(n_samples)
+        h_subset = int(
+            np.ceil(n_samples_subsets * (n_support / float(n_samples))))
+        # perform a total of n_trials trials, select 10 best for each subset
+        n_best_sub = 10
+        n_trials_sub = max(10, n_trials // n_subsets)
+        n_best_tot = n_subsets * n_best_sub
+        all_best_locations = np.zeros((n_best_tot, n_features))
+        # the dual chains of the subsets hand over the factors of their
+        # covariances
+        dual_sub = _is_dual(h_subset, n_features, shrinkage)
+        n_rows = h_subset if dual_sub else n_features
+        try:
+            all_best_covariances = np.zeros(
+                (n_best_tot, n_rows, n_features))
+        except MemoryError:
+            # fall back to fewer (and less optimal) candidates
+            n_best_tot = 10
+            all_best_covariances = np.zeros(
+                (n_best_tot, n_rows, n_features))
+            n_best_sub = 2
+        for i in range(n_subsets):
+            low_bound = i * n_samples_subsets
+            high_bound = low_bound + n_samples_subsets
+            current_subset = X[samples_shuffle[low_bound:high_bound]]
+            best_locations_sub, best_covariances_sub, _, _ = \
+                _select_candidates(current_subset, h_subset, n_trials_sub,
+                                   random_state, select=n_best_sub, n_iter=2,
+                                   n_jobs=n_jobs, shrinkage=shrinkage,
+                                   patience=patience, device=device)
+            subset_slice = np.arange(i * n_best_sub, (i + 1) * n_best_sub)
+            all_best_locations[subset_slice] = best_locations_sub
+            all_best_covariances[subset_slice] = best_covariances_sub
+
+        # 2. pool the candidate supports into a merged set
+        n_samples_merged = min(1500, n_samples)
+        h_merged = int(
+            np.ceil(n_samples_merged * (n_support / float(n_samples))))
+        if n_samples > 1500:
+            n_best_merged = 10
+        else:
+            n_best_merged = 1
+        selection = random_state.permutation(n_samples)[:n_samples_merged]
+        locations_merged, covariances_merged, supports_merged, d = \
+            _select_candidates(X[selection], h_merged,
+                               (all_best_locations, all_best_covariances),
+                               random_state, select=n_best_merged,
+                               n_jobs=n_jobs, shrinkage=shrinkage,
+                               device=device, factored=dual_sub)
+        dual_merged = _is_dual(h_merged, n_features, shrinkage)
+
+        # 3. get the overall best (location, covariance) couple
+        if n_samples < 1500:
+            location = locations_merged[0]
+            covariance = covariances_merged[0]
+            if dual_merged:
+                covariance = _dual_covariance(covariance, shrinkage)
+            support = np.zeros(n_samples, dtype=bool)
+            dist = np.zeros(n_samples)
+            support[selection] = supports_merged[0]
+            dist[selection] = d[0]
+        else:
+            locations_full, covariances_full, supports_full, d = \
+                _select_candidates(X, n_support,
+                                   (locations_merged, covariances_merged),
+                                   random_state, select=1, n_jobs=n_jobs,
+                                   shrinkage=shrinkage, device=device,
+                                   factored=dual_merged)
+            location = locations_full[0]
+            covariance = covariances_full[0]
+            if dual:
+                covariance = _dual_covariance(covariance, shrinkage)
+            support = supports_full[0]
+            dist = d[0]
+
+    elif n_features > 1:
+        # 1. find the 10 best couples considering two iterations
+        n_best = 10
+        locations_best, covariances_best, _, _ = _select_candidates(
+            X, n_support, 30, random_state, select=n_best, n_iter=2,
+            shrinkage=shrinkage, device=device)
+        # 2. select the best couple on the full data set amongst the 10
+        locations_full, covariances_full, supports_full, d = \
+            _select_candidates(X, n_support,
+                               (locations_best, covariances_best),
+                               random_state, select=1, shrinkage=shrinkage,
+                               device=device, factored=dual)
+        location = locations_full[0]
+        covariance = covariances_full[0]
+        if dual:
+            covariance = _dual_covariance(covariance, shrinkage)
+        support = supports_full[0]
+        dist = d[0]
+
+    return location, covariance, support, dist
+
+
+class MinCovDetParallel(MinCovDet):
+    """scikit-learn :class:`~sklearn.covariance.MinCovDet` running the
+    FastMCD trial loop in ``n_jobs`` threads.
+
+    Parameters
+    ----------
+    store_precision : bool, optional (default=True)
+        Specify if the estimated precision is stored.
+
+    assume_centered : bool, optional (default=False)
+        If True, the robust covariance is recomputed from the support
+        without centering the data.
+
+    support_fraction : float, optional (default=None)
+        The proportion of points to be included in the support of the raw
+        MCD estimate.
+
+    random_state : int, RandomState instance or None, optional (default=None)
+        The random number generator for the subsets and initial supports.
+
+    n_jobs : int, optional (default=None)
+        The number of threads running the trial loop.
+        ``None`` means 1 unless in a :obj:`joblib.parallel_backend` context.
+        ``-1`` means using all processors.
+
+    shrinkage : float, optional (default=None)
+        The value added to the diagonal of covariances estimated from fewer
+        observations than features, which are otherwise singular.
+
+    method : str, optional (default='mcd')
+        'mcd' runs FastMCD. 'winsorized' clips each feature at its
+        ``winsor_pct`` and ``1 - winsor_pct`` percentiles and uses the
+        empirical estimates of the clipped data, in a single pass.
+
+    winsor_pct : float in [0., 0.5), optional (default=0.05)
+        The fraction clipped at each tail when ``method='winsorized'``.
+
+    n_trials : int, optional (default=500)
+        The total number of random starts of FastMCD over the subsets.
+
+    patience : int, optional (default=50)
+        The random starts of a subset stop once its 10 lowest determinants
+        have not decreased over ``patience`` trials. None runs all the
+        trials, as scikit-learn does.
+
+    device : {'cpu', 'cuda'}, optional (default='cpu')
+        The device running the C-step chains; 'cuda' requires cupy.
+
+    warm_start : bool, optional (default=False)
+        When refitting on as many samples, start the C-steps from the
+        ``raw_support_`` of the previous fit instead of random subsets.
+    """
+
+    def __init__(self, store_precision=True, assume_centered=False,
+                 support_fraction=None, random_state=None, n_jobs=None,
+                 shrinkage=None, method='mcd', winsor_pct=0.05,
+                 n_trials=500, patience=50, device='cpu',
+                 warm_start=False):
+        super(MinCovDetParallel, self).__init__(
+            store_precision=store_precision,
+            assume_centered=assume_centered,
+            support_fraction=support_fraction,
+            random_state=random_state)
+        self.n_jobs = n_jobs
+        self.shrinkage = shrinkage
+        self.method = method
+        self.winsor_pct = winsor_pct
+        self.n_trials = n_trials
+        self.patience = patience
+        self.device = device
+        self.warm_start = warm_start
+
+    def fit(self, X, y=None):
+        """Fit a Minimum Covariance Determinant with the FastMCD algorithm.
+
+        Parameters
+        ----------
+        X : numpy array of shape (n_samples, n_features)
+            The input samples.
+
+        y : Ignored
+            Not used, present for API consistency by convention.
+
+        Returns
+        -------
+        self : object
+            Fitted estimator.
+        """
+        X = check_array(X, ensure_min_samples=2, estimator='MinCovDet',
+                        dtype=FLOAT_DTYPES)
+        if self.shrinkage is not None and self.shrinkage <= 0:
+            raise ValueError("shrinkage must be positive, got %s"
+                             % self.shrinkage)
+        if self.method not in ('mcd', 'winsorized'):
+            raise ValueError("method must be 'mcd' or 'winsorized', "
+                             "got %s" % self.method)
+        if self.method == 'winsorized':
+            return self._fit_winsorized(X)
+        if self.n_trials < 1:
+            raise ValueError("n_trials must be positive, got %s"
+                             % self.n_trials)
+        if self.patience is not None and self.patience < 1:
+            raise ValueError("patience must be positive, got %s"
+                             % self.patience)
+        if self.device not in ('cpu', 'cuda'):
+            raise ValueError("device must be 'cpu' or 'cuda', got %s"
+                             % self.device)
+        # fail early if cupy is missing
+        _array_module(self.device)
+
+        random_state = check_random_state(self.random_state)
+        n_samples, n_features = X.shape
+        # check that the empirical covariance is full rank, which it cannot
+        # be with fewer samples than features
+        if (n_samples < n_features or
+                (linalg.svdvals(np.dot(X.T, X)) > 1e-8).sum() != n_features):
+            warnings.warn("The covariance matrix associated to your dataset "
+                          "is not full rank")
+
+        warm_support = None
+        if self.warm_start:
+            warm_support = getattr(self, 'raw_support_', None)
+        raw_location, raw_covariance, raw_support, raw_dist = fast_mcd(
+            X, support_fraction=self.support_fraction,
+            random_state=random_state, n_jobs=self.n_jobs,
+            shrinkage=self.shrinkage, n_trials=self.n_trials,
+            patience=self.patience, device=self.device,
+            warm_support=warm_support)
+        if self.assume_centered:
+            raw_location = np.zeros(n_features)
+            raw_covariance = self._nonrobust_covariance(
+                X[raw_support], assume_centered=True)
+            precision = linalg.pinvh(raw_covariance)
+            raw_dist = np.sum(np.dot(X, precision) * X, 1)
+        self.raw_location_ = raw_location
+        self.raw_covariance_ = raw_covariance
+        self.raw_support_ = raw_support
+        self.location_ = raw_location
+        self.support_ = raw_support
+        self.dist_ = raw_dist
+        # obtain consistency at normal models
+        self.correct_covariance(X)
+        # re-weight estimator
+        self.reweight_covariance(X)
+
+        return self
+
+    def _fit_winsorized(self, X):
+        """Fit the empirical estimates of the winsorized data.
+
+        Parameters
+        ----------
+        X : numpy array of shape (n_samples, n_features)
+            The input samples.
+
+        Returns
+        -------
+        self : object
+            Fitted estimator.
+        """
+        if not 0. <= self.winsor_pct < 0.5:
+            raise ValueError("winsor_pct must be in [0, 0.5), got %s"
+                             % self.winsor_pct)
+        n_samples, n_features = X.shape
+        lower, upper = np.percentile(
+            X, [100 * self.winsor_pct, 100 * (1 - self.winsor_pct)], axis=0)
+        X_clipped = np.clip(X, lower, upper)
+
+        if self.assume_centered:
+            location = np.zeros(n_features)
+        else:
+            location = X_clipped.mean(axis=0)
+        covariance = self._nonrobust_covariance(
+            X_clipped, assume_centered=self.assume_centered)
+
+        # every sample contributes to the estimates
+        support = np.ones(n_samples, dtype=bool)
+        self.raw_location_ = location
+        self.raw_covariance_ = covariance
+        self.raw_support_ = support
+        self.location_ = location
+        self.support_ = support
+        self._set_covariance(covariance)
+        self.dist_ = _distances(X, location, self.get_precision())
+        return self
+
+    def _nonrobust_covariance(self, X, assume_centered=False):
+        """Empirical covariance of the (re-weighted) support, shrunk when
+        the support has fewer observations than features."""
+        if self.shrinkage is not None and X.shape[0] < X.shape[1]:
+            return _shrunk_covariance(X, self.shrinkage,
+                                      assume_centered=assume_centered)
+        return empirical_covariance(X, assume_centered=assume_centered)
+
+    def _set_covariance(self, covariance):
+        """Save the covariance and, if stored, the precision matrix.
+
+        For n_features >= 256 the precision is computed from the Cholesky
+        factorization of the covariance, an order of magnitude faster than
+        the pseudo inverse for well conditioned matrices.
+
+        Parameters
+        ----------
+        covariance : numpy array of shape (n_features, n_features)
+            The estimated covariance matrix.
+        """
+        covariance = check_array(covariance)
+        self.covariance_ = covariance
+        if not self.store_precision:
+            self.precision_ = None
+        elif covariance.shape[0] >= 256:
+            self.precision_ = _inv_cholesky(covariance)
+        else:
+            self.precision_ = linalg.pinvh(covariance, check_finite=False)
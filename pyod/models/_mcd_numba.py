@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+"""Numba kernels for the C-steps of FastMCD on low dimensional data.
+"""
+# License: BSD 2 clause
+
+
+import numpy as np
+from numba import njit
+
+
+@njit(cache=True, nogil=True)
+def _mahalanobis_all(X, location, precision):
+    """Squared Mahalanobis distances of all the samples, centering each
+    sample on the fly.
+
+    Parameters
+    ----------
+    X : numpy array of shape (n_samples, n_features)
+        The input samples.
+
+    location : numpy array of shape (n_features,)
+        The location the distances are computed from.
+
+    precision : numpy array of shape (n_features, n_features)
+        The (pseudo) inverse of the covariance matrix.
+
+    Returns
+    -------
+    dist : numpy array of shape (n_samples,)
+        Squared Mahalanobis distances of the samples.
+    """
+    n_samples, n_features = X.shape
+    dist = np.empty(n_samples)
+    diff = np.empty(n_features)
+    for i in range(n_samples):
+        for j in range(n_features):
+            diff[j] = X[i, j] - location[j]
+        d = 0.
+        for j in range(n_features):
+            s = 0.
+            for k in range(n_features):
+                s += precision[j, k] * diff[k]
+            d += diff[j] * s
+        dist[i] = d
+    return dist
+
+
+@njit(cache=True, nogil=True)
+def _partial_argsort_h(dist, n_support):
+    """Indices of the ``n_support`` smallest distances, in no particular
+    order.
+
+    Parameters
+    ----------
+    dist : numpy array of shape (n_samples,)
+        The distances of the samples.
+
+    n_support : int
+        The number of indices to select.
+
+    Returns
+    -------
+    index : numpy array of shape (n_support,)
+        The indices of the samples with the smallest distances.
+    """
+    return np.argpartition(dist, n_support - 1)[:n_support]
+
+
+@njit(cache=True, nogil=True)
+def _cov_of_subset(X, index):
+    """Mean and (biased) empirical covariance of the rows ``index`` of X,
+    accumulated row by row without copying the subset.
+
+    Parameters
+    ----------
+    X : numpy array of shape (n_samples, n_features)
+        The input samples.
+
+    index : numpy array of shape (n_support,)
+        The indices of the rows of the subset.
+
+    Returns
+    -------
+    location : numpy array of shape (n_features,)
+        The mean of the subset.
+
+    covariance : numpy array of shape (n_features, n_features)
+        The empirical covariance of the subset.
+    """
+    n_support = index.shape[0]
+    n_features = X.shape[1]
+    location = np.zeros(n_features)
+    for i in range(n_support):
+        for j in range(n_features):
+            location[j] += X[index[i], j]
+    location /= n_support
+
+    covariance = np.zeros((n_features, n_features))
+    diff = np.empty(n_features)
+    for i in range(n_support):
+        for j in range(n_features):
+            diff[j] = X[index[i], j] - location[j]
+        # rank one update of the upper triangle
+        for j in range(n_features):
+            for k in range(j, n_features):
+                covariance[j, k] += diff[j] * diff[k]
+    for j in range(n_features):
+        for k in range(j, n_features):
+            covariance[j, k] /= n_support
+            covariance[k, j] = covariance[j, k]
+    return location, covariance
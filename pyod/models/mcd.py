@@ -5,15 +5,109 @@
 # License: BSD 2 clause
 
 
-from sklearn.covariance import MinCovDet
+import numpy as np
+from joblib import Parallel, delayed, effective_n_jobs
+from scipy import linalg
+from scipy.linalg.blas import get_blas_funcs
 from sklearn.utils.validation import check_array
 from sklearn.utils.validation import check_is_fitted
 
+from ._fast_mcd_parallel import MinCovDetParallel
 from .base import BaseDetector
 
 __all__ = ['MCD']
 
 
+def _mahalanobis(X, location, precision, out=None):
+    """Squared Mahalanobis distances of the samples, with the row-wise
+    reduction fused into a single einsum pass.
+
+    Parameters
+    ----------
+    X : numpy array of shape (n_samples, n_features)
+        The input samples.
+
+    location : numpy array of shape (n_features,)
+        The location the distances are computed from.
+
+    precision : numpy array of shape (n_features, n_features)
+        The (pseudo) inverse of the covariance matrix.
+
+    out : numpy array of shape (n_samples, n_features), optional
+        C-contiguous buffer receiving the centered samples.
+
+    Returns
+    -------
+    dist : numpy array of shape (n_samples,)
+        Squared Mahalanobis distances of the samples.
+    """
+    X_centered = np.subtract(X, location, out=out, order='C')
+    return np.einsum('ij,ij->i', np.dot(X_centered, precision), X_centered)
+
+
+def _mahalanobis_cholesky(X, location, chol_prec, out=None):
+    """Squared Mahalanobis distances given the lower Cholesky factor L of
+    the precision matrix, i.e., the squared norms of the rows of
+    (X - location) L.
+
+    Parameters
+    ----------
+    X : numpy array of shape (n_samples, n_features)
+        The input samples.
+
+    location : numpy array of shape (n_features,)
+        The location the distances are computed from.
+
+    chol_prec : numpy array of shape (n_features, n_features)
+        Lower triangular Cholesky factor of the precision matrix.
+
+    out : numpy array of shape (n_samples, n_features), optional
+        C-contiguous buffer receiving the centered samples, overwritten by
+        the triangular product.
+
+    Returns
+    -------
+    dist : numpy array of shape (n_samples,)
+        Squared Mahalanobis distances of the samples.
+    """
+    X_centered = np.subtract(X, location, out=out, order='C')
+    # the transpose of the centered samples is Fortran ordered, so the
+    # triangular product L^T (X - location)^T is computed in place
+    trmm = get_blas_funcs('trmm', (chol_prec, X_centered))
+    Z = trmm(1.0, chol_prec, X_centered.T, lower=1, trans_a=1,
+             overwrite_b=1)
+    return np.einsum('ij,ij->j', Z, Z)
+
+
+def _mahalanobis_low_dim(X, location, precision):
+    """Squared Mahalanobis distances of one or two dimensional samples in
+    closed form, with elementwise operations only.
+
+    Parameters
+    ----------
+    X : numpy array of shape (n_samples, n_features), n_features <= 2
+        The input samples.
+
+    location : numpy array of shape (n_features,)
+        The location the distances are computed from, whose size decides
+        between the one and two dimensional forms.
+
+    precision : numpy array of shape (n_features, n_features)
+        The (pseudo) inverse of the covariance matrix.
+
+    Returns
+    -------
+    dist : numpy array of shape (n_samples,)
+        Squared Mahalanobis distances of the samples.
+    """
+    dx = X[:, 0] - location[0]
+    if location.shape[0] == 1:
+        return dx * dx * precision[0, 0]
+    dy = X[:, 1] - location[1]
+    return (precision[0, 0] * dx * dx + 2 * precision[0, 1] * dx * dy +
+            precision[1, 1] * dy * dy)
+
+
 class MCD(BaseDetector):
     """Detecting outliers in a Gaussian distributed dataset using
     Minimum Covariance Determinant (MCD): robust estimator of covariance.
@@ -62,6 +156,70 @@ class MCD(BaseDetector):
         If None, the random number generator is the RandomState instance used
         by `np.random`.
 
+    n_jobs : int, optional (default=None)
+        The number of threads running the FastMCD trial loop when the data
+        set is split into subsets, i.e., n_samples > 500, and scoring the
+        batches of more than 100000 samples by row chunks.
+        ``None`` means 1 unless in a :obj:`joblib.parallel_backend` context.
+        ``-1`` means using all processors.
+
+    dtype : str, optional (default='float64')
+        The floating point precision of the Mahalanobis distances,
+        'float64' or 'float32'. Single precision halves the memory traffic
+        of scoring; the scores differ slightly, which may swap the rank of
+        nearly tied samples. ``decision_scores_`` and ``threshold_`` are
+        computed with the same precision.
+
+    shrinkage : float, optional (default=None)
+        If given, covariances estimated from fewer observations than
+        features (n_support < n_features, e.g., high dimensional data with
+        few samples) get ``shrinkage`` added to their diagonal. The C-steps
+        are then solved on the n_support x n_support dual problem through
+        Sylvester's determinant identity, in O(n_support^2 * n_features)
+        instead of O(n_features^3). Ignored when n_support >= n_features.
+        Unless ``support_fraction`` is given, a default support of
+        [n_sample + n_features + 1] / 2 that covers the whole data set
+        (n_features >= n_samples - 1) is reduced to 3/4 of the samples;
+        otherwise the default is unchanged.
+
+    method : str, optional (default='mcd')
+        The estimator of the location and covariance.
+
+        - 'mcd': the Minimum Covariance Determinant fitted by FastMCD.
+        - 'winsorized': clip each feature at its ``winsor_pct`` and
+          ``1 - winsor_pct`` percentiles and use the empirical estimates of
+          the clipped data. A single pass over the data, much faster than
+          FastMCD on large data sets, but less robust to outliers that are
+          not extreme in any single feature.
+
+    winsor_pct : float in [0., 0.5), optional (default=0.05)
+        The fraction of each feature clipped at each tail when
+        ``method='winsorized'``.
+
+    n_trials : int, optional (default=500)
+        The total number of random initial subsets FastMCD runs C-steps
+        from, split over the subsets of the data (n_samples > 500).
+
+    patience : int or None, optional (default=50)
+        Stop the random starts of a subset once its 10 lowest
+        determinants have not decreased over ``patience`` consecutive
+        trials. The stopping point does not depend on ``n_jobs``.
+        None runs all ``n_trials`` trials.
+
+    device : str, optional (default='cpu')
+        The device running the C-steps of FastMCD, 'cpu' or 'cuda'.
+        'cuda' requires cupy: the samples are copied to the GPU once per
+        stage and the C-step chains run there, which pays off for large
+        data sets (n_samples >= 1e5). The fitted estimates are numpy
+        arrays either way.
+
+    warm_start : bool, optional (default=False)
+        When set to True, refitting on the same number of samples runs the
+        C-steps from the raw support of the previous fit instead of the
+        random trials of FastMCD, which converges in a few steps on slowly
+        drifting data. Otherwise, or if the number of samples changed, the
+        full FastMCD runs.
+
     Attributes
     ----------
     raw_location_ : array-like, shape (n_features,)
@@ -108,14 +266,32 @@ class MCD(BaseDetector):
         ``threshold_`` on ``decision_scores_``.
     """
 
+    # batches up to this size are centered into a preallocated buffer
+    _max_batch = 4096
+
+    # larger batches are scored by row chunks in n_jobs threads
+    _min_parallel_batch = 100000
+
     def __init__(self, contamination=0.1, store_precision=True,
                  assume_centered=False, support_fraction=None,
-                 random_state=None):
+                 random_state=None, n_jobs=None, dtype='float64',
+                 shrinkage=None, method='mcd', winsor_pct=0.05,
+                 n_trials=500, patience=50, device='cpu',
+                 warm_start=False):
         super(MCD, self).__init__(contamination=contamination)
         self.store_precision = store_precision
         self.assume_centered = assume_centered
         self.support_fraction = support_fraction
         self.random_state = random_state
+        self.n_jobs = n_jobs
+        self.dtype = dtype
+        self.shrinkage = shrinkage
+        self.method = method
+        self.winsor_pct = winsor_pct
+        self.n_trials = n_trials
+        self.patience = patience
+        self.device = device
+        self.warm_start = warm_start
 
     # noinspection PyIncorrectDocstring
     def fit(self, X, y=None):
@@ -138,18 +314,56 @@ class MCD(BaseDetector):
         X = check_array(X)
         self._set_n_classes(y)
 
-        self.detector_ = MinCovDet(store_precision=self.store_precision,
-                                   assume_centered=self.assume_centered,
-                                   support_fraction=self.support_fraction,
-                                   random_state=self.random_state)
+        if self.dtype not in ('float64', 'float32'):
+            raise ValueError("dtype must be 'float64' or 'float32', "
+                             "got %s" % self.dtype)
+
+        params = dict(
+            store_precision=self.store_precision,
+            assume_centered=self.assume_centered,
+            support_fraction=self.support_fraction,
+            random_state=self.random_state,
+            n_jobs=self.n_jobs,
+            shrinkage=self.shrinkage,
+            method=self.method,
+            winsor_pct=self.winsor_pct,
+            n_trials=self.n_trials,
+            patience=self.patience,
+            device=self.device,
+            warm_start=self.warm_start)
+        if self.warm_start and hasattr(self, 'detector_'):
+            # keep the fitted detector, its raw support seeds the C-steps
+            self.detector_.set_params(**params)
+        else:
+            self.detector_ = MinCovDetParallel(**params)
         self.detector_.fit(X=X, y=y)
 
+        # Cache the scoring parameters in the scoring precision, including
+        # the Cholesky factor of the precision
+        self._score_buf = None
+        self._score_loc_ = self.detector_.location_.astype(self.dtype)
+        self._score_prec_ = None
+        if self.location_.shape[0] <= 2:
+            self._score_prec_ = self.detector_.get_precision().astype(
+                self.dtype)
+        self._chol_prec_ = None
+        if self.store_precision:
+            try:
+                self._chol_prec_ = linalg.cholesky(
+                    self.detector_.precision_, lower=True).astype(self.dtype)
+            except linalg.LinAlgError:
+                # singular covariance, score with the pseudo inverse
+                pass
+
         # Use mahalanabis distance as the outlier score
-        self.decision_scores_ = self.detector_.dist_
+        if self.dtype == 'float64':
+            self.decision_scores_ = self.detector_.dist_
+        else:
+            self.decision_scores_ = self._score(X.astype(self.dtype))
         self._process_decision_scores()
         return self
 
-    def decision_function(self, X):
+    def decision_function(self, X, check_input=True):
         """Predict raw anomaly score of X using the fitted detector.
 
         The anomaly score of an input sample is computed based on different
@@ -162,16 +376,96 @@ class MCD(BaseDetector):
             The training input samples. Sparse matrices are accepted only
             if they are supported by the base estimator.
 
+        check_input : bool, optional (default=True)
+            Validate X with ``check_array``. If False, the validation and
+            its possible copy are skipped: the caller guarantees that X is
+            a finite, C-contiguous numpy array of the ``dtype`` of the
+            detector, with the number of features seen in fit.
+
         Returns
         -------
         anomaly_scores : numpy array of shape (n_samples,)
             The anomaly score of the input samples.
         """
         check_is_fitted(self, ['decision_scores_', 'threshold_', 'labels_'])
-        X = check_array(X)
+        if check_input:
+            X = check_array(X, dtype=self.dtype)
+            n_features = self.location_.shape[0]
+            if X.shape[1] != n_features:
+                raise ValueError(
+                    "X has %d features, but MCD is expecting %d features "
+                    "as input." % (X.shape[1], n_features))
 
         # Computer mahalanobis distance of the samples
-        return self.detector_.mahalanobis(X)
+        return self._score(X)
+
+    def _score(self, X):
+        """Mahalanobis distances of validated samples of the scoring dtype.
+
+        Batches of more than ``_min_parallel_batch`` samples are split into
+        ``n_jobs`` row chunks scored in threads.
+
+        Parameters
+        ----------
+        X : numpy array of shape (n_samples, n_features)
+            The input samples.
+
+        Returns
+        -------
+        anomaly_scores : numpy array of shape (n_samples,)
+            The anomaly score of the input samples.
+        """
+        # without a stored Cholesky factor, the pseudo inverse is computed
+        # once for all the chunks
+        precision = None
+        if self._chol_prec_ is None and self._score_prec_ is None:
+            precision = self.detector_.get_precision().astype(self.dtype)
+
+        n_jobs = effective_n_jobs(self.n_jobs)
+        if X.shape[0] > self._min_parallel_batch and n_jobs > 1:
+            # the kernels release the GIL, so the chunks run concurrently
+            scores = Parallel(n_jobs=n_jobs, prefer='threads')(
+                delayed(self._score_chunk)(X_chunk, precision)
+                for X_chunk in np.array_split(X, n_jobs))
+            return np.concatenate(scores)
+        return self._score_chunk(X, precision)
+
+    def _score_chunk(self, X, precision=None):
+        """Mahalanobis distances of a chunk of samples, see :meth:`_score`.
+        ``precision`` is used when no Cholesky factor is stored.
+        """
+        n_samples = X.shape[0]
+        n_features = self._score_loc_.shape[0]
+        if n_features <= 2:
+            return _mahalanobis_low_dim(X, self._score_loc_,
+                                        self._score_prec_)
+
+        buffer = None
+        out = None
+        if n_samples <= self._max_batch:
+            # small batches center the samples into a buffer reused across
+            # calls and grown to the largest of them; it is taken off the
+            # detector while in use, so that concurrent calls never share it
+            buffer = self.__dict__.pop('_score_buf', None)
+            if buffer is None or buffer.shape[0] < n_samples:
+                buffer = np.empty((n_samples, n_features), dtype=self.dtype)
+            out = buffer[:n_samples]
+
+        if self._chol_prec_ is None:
+            scores = _mahalanobis(X, self._score_loc_, precision, out=out)
+        else:
+            scores = _mahalanobis_cholesky(X, self._score_loc_,
+                                           self._chol_prec_, out=out)
+        # only given back once the batch is scored
+        if buffer is not None:
+            self._score_buf = buffer
+        return scores
+
+    def __getstate__(self):
+        # the scoring buffer is scratch memory, not worth pickling
+        state = self.__dict__.copy()
+        state.pop('_score_buf', None)
+        return state
 
     @property
     def raw_location_(self):
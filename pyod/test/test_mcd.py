@@ -2,9 +2,12 @@
 
 
 import os
+import pickle
 import sys
 import unittest
 
+import numpy as np
+
 # noinspection PyProtectedMember
 from numpy.testing import assert_allclose
 from numpy.testing import assert_array_less
@@ -73,6 +76,116 @@ class TestMCD(unittest.TestCase):
         # check performance
         assert (roc_auc_score(self.y_test, pred_scores) >= self.roc_floor)
 
+    def test_prediction_scores_mahalanobis(self):
+        pred_scores = self.clf.decision_function(self.X_test)
+        assert_allclose(pred_scores,
+                        self.clf.detector_.mahalanobis(self.X_test))
+
+        # no precision stored, scores are computed by the detector
+        clf = MCD(contamination=self.contamination, store_precision=False,
+                  random_state=42)
+        clf.fit(self.X_train)
+        assert (clf._chol_prec_ is None)
+        assert_allclose(clf.decision_function(self.X_test), pred_scores)
+
+    def test_prediction_scores_check_input(self):
+        pred_scores = self.clf.decision_function(self.X_test)
+        X_test = np.ascontiguousarray(self.X_test, dtype=np.float64)
+        assert_allclose(self.clf.decision_function(X_test, check_input=False),
+                        pred_scores)
+
+    def test_prediction_scores_n_features(self):
+        for X_test in [self.X_test[:, :1], np.tile(self.X_test, 3)]:
+            with assert_raises(ValueError):
+                self.clf.decision_function(X_test)
+
+    def test_prediction_scores_train(self):
+        # the training array modified in place is scored again
+        X = self.X_train.copy()
+        clf = MCD(contamination=self.contamination, random_state=42).fit(X)
+        assert_allclose(clf.decision_function(X), clf.decision_scores_)
+        X[:] = self.X_test[0]
+        assert_allclose(clf.decision_function(X),
+                        clf.decision_function(X.copy()))
+
+    def test_prediction_scores_float32(self):
+        clf = MCD(contamination=self.contamination, random_state=42,
+                  dtype='float32')
+        clf.fit(self.X_train)
+        assert_equal(clf.decision_scores_.dtype, np.float32)
+        assert_allclose(clf.decision_scores_, self.clf.decision_scores_,
+                        rtol=1e-4)
+
+        pred_scores = clf.decision_function(self.X_test)
+        assert_equal(pred_scores.dtype, np.float32)
+        assert_allclose(pred_scores, self.clf.decision_function(self.X_test),
+                        rtol=1e-4)
+
+        with assert_raises(ValueError):
+            MCD(dtype='float16').fit(self.X_train)
+
+    def test_prediction_scores_low_dim(self):
+        for n_features in [1, 2]:
+            X_train = self.X_train[:, :n_features]
+            X_test = self.X_test[:, :n_features]
+            clf = MCD(contamination=self.contamination, random_state=42)
+            clf.fit(X_train)
+            assert_allclose(clf.decision_function(X_test),
+                            clf.detector_.mahalanobis(X_test))
+            with assert_raises(ValueError):
+                clf.decision_function(self.X_test[:, :3 - n_features])
+
+    def test_prediction_scores_buffer(self):
+        X_train, X_test, _, _ = generate_data(
+            n_train=self.n_train, n_test=self.n_test, n_features=5,
+            contamination=self.contamination, random_state=42)
+        clf = MCD(contamination=self.contamination, random_state=42)
+        clf.fit(X_train)
+        pred_scores = clf.decision_function(X_test)
+        assert_allclose(pred_scores, clf.detector_.mahalanobis(X_test))
+        buffer = clf._score_buf
+        assert_equal(buffer.shape, X_test.shape)
+
+        # the buffer is reused by smaller batches and grown by larger ones
+        assert_allclose(clf.decision_function(X_test[:10]), pred_scores[:10])
+        assert (clf._score_buf is buffer)
+        X_twice = np.vstack([X_test, X_test])
+        assert_allclose(clf.decision_function(X_twice)[self.n_test:],
+                        pred_scores)
+        assert_equal(clf._score_buf.shape, X_twice.shape)
+
+        X_large = np.tile(X_test, (MCD._max_batch // self.n_test + 1, 1))
+        assert_allclose(clf.decision_function(X_large)[:self.n_test],
+                        pred_scores)
+
+        # a failed batch leaves the buffer off the detector
+        with assert_raises(ValueError):
+            clf.decision_function(X_test[:, :3], check_input=False)
+        assert_allclose(clf.decision_function(X_test), pred_scores)
+        assert_equal(clf._score_buf.shape[1], X_test.shape[1])
+
+        # and it is not pickled
+        assert ('_score_buf' not in pickle.loads(pickle.dumps(clf)).__dict__)
+
+    def test_winsorized(self):
+        clf = MCD(contamination=self.contamination, method='winsorized',
+                  winsor_pct=0.1)
+        clf.fit(self.X_train)
+        lower, upper = np.percentile(self.X_train, [10, 90], axis=0)
+        assert_allclose(clf.location_,
+                        np.clip(self.X_train, lower, upper).mean(axis=0))
+        assert (clf.support_.all())
+        assert_allclose(clf.decision_scores_,
+                        clf.detector_.mahalanobis(self.X_train))
+
+        pred_scores = clf.decision_function(self.X_test)
+        assert (roc_auc_score(self.y_test, pred_scores) >= self.roc_floor)
+
+        with assert_raises(ValueError):
+            MCD(method='something').fit(self.X_train)
+        with assert_raises(ValueError):
+            MCD(method='winsorized', winsor_pct=0.5).fit(self.X_train)
+
     def test_prediction_labels(self):
         pred_labels = self.clf.predict(self.X_test)
         assert_equal(pred_labels.shape, self.y_test.shape)
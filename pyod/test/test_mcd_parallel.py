@@ -0,0 +1,356 @@
+# -*- coding: utf-8 -*-
+
+
+import os
+import sys
+import unittest
+from unittest.mock import patch
+
+import numpy as np
+
+# noinspection PyProtectedMember
+from numpy.testing import assert_allclose
+from numpy.testing import assert_array_equal
+from numpy.testing import assert_equal
+from numpy.testing import assert_raises
+from scipy import linalg
+from sklearn.base import clone
+from sklearn.covariance import MinCovDet
+from sklearn.covariance import empirical_covariance
+from sklearn.metrics import roc_auc_score
+from sklearn.utils.extmath import fast_logdet
+
+# temporary solution for relative imports in case pyod is not installed
+# if pyod is installed, no need to use the following line
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from pyod.models.mcd import MCD
+from pyod.models._fast_mcd_parallel import MinCovDetParallel
+from pyod.models._fast_mcd_parallel import _batch_precisions
+from pyod.models._fast_mcd_parallel import _c_step
+from pyod.models._fast_mcd_parallel import _c_step_device
+from pyod.models._fast_mcd_parallel import _c_step_dual
+from pyod.models._fast_mcd_parallel import _estimates
+from pyod.models._fast_mcd_parallel import _inv_cholesky
+from pyod.models._fast_mcd_parallel import _shrunk_covariance
+from pyod.models._fast_mcd_parallel import _update_estimates
+from pyod.models._mcd_numba import _cov_of_subset
+from pyod.models._mcd_numba import _mahalanobis_all
+from pyod.models._mcd_numba import _partial_argsort_h
+from pyod.utils.data import generate_data
+
+
+class TestMCDParallel(unittest.TestCase):
+    def setUp(self):
+        self.n_train = 1000
+        self.n_test = 200
+        self.contamination = 0.1
+        self.roc_floor = 0.8
+        self.X_train, self.X_test, self.y_train, self.y_test = generate_data(
+            n_train=self.n_train, n_test=self.n_test, n_features=5,
+            contamination=self.contamination, random_state=42)
+
+        self.clf = MCD(contamination=self.contamination, random_state=42,
+                       n_jobs=2)
+        self.clf.fit(self.X_train)
+
+        # get a copy from the single thread copy
+        self.clf_ = MCD(contamination=self.contamination, random_state=42)
+        self.clf_.fit(self.X_train)
+
+    def test_parameters(self):
+        assert (hasattr(self.clf, 'decision_scores_') and
+                self.clf.decision_scores_ is not None)
+        assert (hasattr(self.clf, 'labels_') and
+                self.clf.labels_ is not None)
+        assert (hasattr(self.clf, 'threshold_') and
+                self.clf.threshold_ is not None)
+        assert isinstance(self.clf.detector_, MinCovDetParallel)
+
+    def test_train_scores(self):
+        assert_equal(len(self.clf.decision_scores_), self.X_train.shape[0])
+        assert_allclose(self.clf.decision_scores_, self.clf_.decision_scores_)
+
+    def test_sklearn_consistency(self):
+        # the trial loop draws the same random starts as scikit-learn
+        for n_samples in [200, self.n_train, 2000]:
+            X, _, _, _ = generate_data(n_train=n_samples, n_test=10,
+                                       n_features=5, random_state=42)
+            detector = MinCovDetParallel(random_state=0, n_jobs=2,
+                                         patience=None).fit(X)
+            reference = MinCovDet(random_state=0).fit(X)
+            assert_array_equal(detector.support_, reference.support_)
+            assert_allclose(detector.location_, reference.location_)
+            assert_allclose(detector.covariance_, reference.covariance_)
+            assert_allclose(detector.dist_, reference.dist_)
+
+        # one dimensional data selects the shortest half
+        detector = MinCovDetParallel(random_state=0).fit(X[:, :1])
+        reference = MinCovDet(random_state=0).fit(X[:, :1])
+        assert_array_equal(detector.raw_support_, reference.raw_support_)
+        assert_allclose(detector.dist_, reference.dist_)
+
+    def test_full_support(self):
+        # support_fraction=1 skips the trials with the same result
+        for n_samples in [200, self.n_train]:
+            X, _, _, _ = generate_data(n_train=n_samples, n_test=10,
+                                       n_features=5, random_state=42)
+            clf = MCD(support_fraction=1, random_state=0).fit(X)
+            reference = MinCovDet(support_fraction=1, random_state=0).fit(X)
+            assert isinstance(clf.detector_, MinCovDetParallel)
+            assert clf.raw_support_.all()
+            assert_allclose(clf.raw_location_, X.mean(axis=0))
+            assert_allclose(clf.raw_covariance_, reference.raw_covariance_)
+            assert_allclose(clf.decision_scores_, reference.dist_)
+
+    def test_patience(self):
+        # the random starts stop at the same trial whatever n_jobs
+        X, _, _, _ = generate_data(n_train=2000, n_test=10, n_features=5,
+                                   random_state=42)
+        detector = MinCovDetParallel(random_state=0, patience=5).fit(X)
+        detector_ = MinCovDetParallel(random_state=0, patience=5,
+                                      n_jobs=2).fit(X)
+        assert_array_equal(detector.raw_support_, detector_.raw_support_)
+        assert_allclose(detector.dist_, detector_.dist_)
+
+        with assert_raises(ValueError):
+            MCD(patience=0).fit(X)
+        with assert_raises(ValueError):
+            MCD(n_trials=0).fit(X)
+
+    def test_precision_cholesky(self):
+        rng = np.random.RandomState(42)
+        A = rng.randn(600, 300)
+        covariance = np.dot(A.T, A) / 600
+        detector = MinCovDetParallel()
+        detector._set_covariance(covariance)
+        assert_allclose(detector.precision_, linalg.pinvh(covariance),
+                        atol=1e-8)
+
+        # singular matrices fall back to the pseudo inverse
+        covariance[:, 0] = covariance[0, :] = 0
+        assert_allclose(_inv_cholesky(covariance), linalg.pinvh(covariance),
+                        atol=1e-8)
+
+    def test_precision(self):
+        assert_allclose(self.clf.precision_,
+                        linalg.pinvh(self.clf.covariance_))
+        # a stored array, not a copy rebuilt on each access
+        assert (self.clf.precision_ is self.clf.precision_)
+        assert (MCD(store_precision=False).fit(
+            self.X_train).precision_ is None)
+
+    def test_batch_precisions(self):
+        rng = np.random.RandomState(42)
+        A = rng.randn(10, 60, 20)
+        covariances = np.matmul(np.swapaxes(A, 1, 2), A) / 60
+        expected = np.array([linalg.pinvh(c) for c in covariances])
+        assert_allclose(_batch_precisions(covariances), expected, atol=1e-8)
+
+        # a singular matrix in the stack falls back to the pseudo inverses
+        covariances[3, :, 0] = covariances[3, 0, :] = 0
+        expected[3] = linalg.pinvh(covariances[3])
+        assert_allclose(_batch_precisions(covariances), expected, atol=1e-8)
+
+    def test_c_step_dual(self):
+        # the dual C-step matches the estimates of the shrunk covariance
+        rng = np.random.RandomState(42)
+        X = rng.randn(60, 200)
+        support = np.zeros(60, dtype=bool)
+        support[rng.permutation(60)[:40]] = True
+        location, _, det, support, dist = _c_step_dual(
+            X, 40, 0.5, initial_support=support)
+        covariance = _shrunk_covariance(X[support], 0.5)
+        X_centered = X - location
+        assert_allclose(location, X[support].mean(axis=0))
+        assert_allclose(det, fast_logdet(covariance))
+        assert_allclose(dist, np.sum(
+            np.dot(X_centered, linalg.inv(covariance)) * X_centered, 1))
+
+    def test_c_step_device(self):
+        # the device chain run by numpy matches the CPU chain
+        rng = np.random.RandomState(42)
+        X = rng.randn(300, 5)
+        support = np.zeros(300, dtype=bool)
+        support[rng.permutation(300)[:200]] = True
+        expected = _c_step(X, 200, initial_support=support)
+        results = _c_step_device(X, 200, np, initial_support=support)
+        assert_array_equal(results[3], expected[3])
+        for result, value in zip(results[:3] + results[4:],
+                                 expected[:3] + expected[4:]):
+            assert_allclose(result, value)
+
+        results = _c_step_device(X, 200, np,
+                                 initial_estimates=expected[:2])
+        assert_array_equal(results[3], _c_step(
+            X, 200, initial_estimates=expected[:2])[3])
+
+        with assert_raises(ValueError):
+            MCD(device='tpu').fit(X)
+        try:
+            import cupy
+        except ImportError:
+            with assert_raises(ImportError):
+                MCD(device='cuda').fit(X)
+
+    def test_numba_kernels(self):
+        rng = np.random.RandomState(42)
+        X = rng.randn(100, 5)
+        location = rng.randn(5)
+        A = rng.randn(5, 5)
+        precision = np.dot(A, A.T)
+        X_centered = X - location
+        assert_allclose(_mahalanobis_all(X, location, precision),
+                        np.sum(np.dot(X_centered, precision) * X_centered, 1))
+
+        dist = rng.rand(100)
+        assert_array_equal(np.sort(_partial_argsort_h(dist, 60)),
+                           np.sort(np.argsort(dist)[:60]))
+
+        index = rng.permutation(100)[:60]
+        location, covariance = _cov_of_subset(X, index)
+        assert_allclose(location, X[index].mean(axis=0))
+        assert_allclose(covariance, empirical_covariance(X[index]))
+
+    def test_estimates(self):
+        rng = np.random.RandomState(42)
+        for n_features in [5, 50]:
+            X = rng.randn(200, n_features)
+            support = np.zeros(200, dtype=bool)
+            support[rng.permutation(200)[:120]] = True
+            location, covariance = _estimates(X, support)
+            assert_allclose(location, X[support].mean(axis=0))
+            assert_allclose(covariance, empirical_covariance(X[support]))
+
+    def test_integer_input(self):
+        # integer samples are fitted as floats on both sides of the numba
+        # threshold
+        rng = np.random.RandomState(42)
+        for n_features in [5, 40]:
+            X = rng.randint(0, 100, (300, n_features))
+            clf = MCD(random_state=0).fit(X)
+            reference = MinCovDet(random_state=0).fit(X)
+            assert_allclose(clf.raw_location_, reference.raw_location_)
+            assert_allclose(clf.decision_scores_, reference.dist_)
+
+    def test_update_estimates(self):
+        rng = np.random.RandomState(42)
+        X = rng.randn(200, 5) + 10
+        support = np.zeros(200, dtype=bool)
+        support[:120] = True
+        location, covariance = _estimates(X, support)
+        sums = (location, np.zeros(5), 120 * covariance)
+
+        # a few samples swapped: the running sums are updated
+        new_support = support.copy()
+        new_support[:10] = False
+        new_support[150:160] = True
+        location, covariance, sums = _update_estimates(
+            X, support, new_support, sums)
+        assert_allclose(location, X[new_support].mean(axis=0))
+        assert_allclose(covariance, empirical_covariance(X[new_support]))
+
+        # most of the support swapped: the estimates are recomputed
+        support = new_support
+        new_support = np.zeros(200, dtype=bool)
+        new_support[80:200] = True
+        location, covariance, sums = _update_estimates(
+            X, support, new_support, sums)
+        assert_allclose(sums[0], X[new_support].mean(axis=0))
+        assert_allclose(covariance, empirical_covariance(X[new_support]))
+
+    def test_shrinkage(self):
+        # more features than samples: the C-steps run on the dual problem
+        rng = np.random.RandomState(42)
+        X = rng.randn(60, 200)
+        X[:5] += 1
+        for support_fraction in [None, 0.5]:
+            with patch('pyod.models._fast_mcd_parallel._c_step_dual',
+                       wraps=_c_step_dual) as c_step_dual, \
+                    patch('pyod.models._fast_mcd_parallel._batch_precisions',
+                          wraps=_batch_precisions) as batch_precisions:
+                clf = MCD(shrinkage=10, support_fraction=support_fraction,
+                          random_state=42).fit(X)
+            assert (c_step_dual.call_count > 0)
+            # candidates are handed over as factors, never as p x p matrices
+            assert (batch_precisions.call_count == 0)
+            assert (clf.raw_support_.sum() < 60)
+            assert (not clf.raw_support_[:5].any())
+            assert (clf.decision_scores_[:5].min() >
+                    np.median(clf.decision_scores_[5:]))
+
+        # the default support is only reduced when it covers all samples
+        X_low = rng.randn(100, 60)
+        clf = MCD(shrinkage=1, random_state=42).fit(X_low)
+        assert_equal(clf.raw_support_.sum(), 81)
+
+        # the whole data set as support is shrunk as well
+        clf = MCD(shrinkage=0.5, support_fraction=1, random_state=42).fit(X)
+        assert_allclose(clf.raw_covariance_, _shrunk_covariance(X, 0.5))
+
+        with assert_raises(ValueError):
+            MCD(shrinkage=0).fit(X)
+
+    def test_warm_start(self):
+        # a refit on slightly drifted data starts from the previous support
+        rng = np.random.RandomState(42)
+        X = self.X_train + 0.01 * rng.randn(*self.X_train.shape)
+        clf = MCD(contamination=self.contamination, random_state=42,
+                  warm_start=True)
+        clf.fit(self.X_train)
+        detector = clf.detector_
+        clf.fit(X)
+        assert (clf.detector_ is detector)
+
+        reference = MCD(contamination=self.contamination,
+                        random_state=42).fit(X)
+        assert (np.mean(clf.raw_support_ == reference.raw_support_) > 0.95)
+        assert_allclose(clf.location_, reference.location_, atol=0.05)
+        assert (roc_auc_score(self.y_train, clf.decision_scores_) >=
+                self.roc_floor)
+
+        # a different number of samples runs the full FastMCD
+        clf.fit(X[:500])
+        reference = MCD(contamination=self.contamination,
+                        random_state=42).fit(X[:500])
+        assert_allclose(clf.decision_scores_, reference.decision_scores_)
+
+    def test_prediction_scores(self):
+        pred_scores = self.clf.decision_function(self.X_test)
+        pred_scores_ = self.clf_.decision_function(self.X_test)
+
+        # check score shapes
+        assert_equal(pred_scores.shape[0], self.X_test.shape[0])
+        assert_allclose(pred_scores, pred_scores_)
+
+        # check performance
+        assert (roc_auc_score(self.y_test, pred_scores) >= self.roc_floor)
+
+    def test_prediction_scores_chunks(self):
+        # large batches are scored by row chunks in threads
+        X_large = np.tile(self.X_test, (10, 1))
+        self.clf._min_parallel_batch = self.n_test
+        assert_allclose(self.clf.decision_function(X_large),
+                        self.clf_.decision_function(X_large))
+
+        # without a stored precision, the chunks share one pseudo inverse
+        clf = MCD(contamination=self.contamination, random_state=42,
+                  store_precision=False, n_jobs=2).fit(self.X_train)
+        clf._min_parallel_batch = self.n_test
+        assert_allclose(clf.decision_function(X_large),
+                        self.clf_.decision_function(X_large))
+
+    def test_prediction_labels(self):
+        pred_labels = self.clf.predict(self.X_test)
+        assert_equal(pred_labels.shape, self.y_test.shape)
+
+    def test_model_clone(self):
+        clone_clf = clone(self.clf)
+        assert_equal(clone_clf.n_jobs, self.clf.n_jobs)
+
+    def tearDown(self):
+        pass
+
+
+if __name__ == '__main__':
+    unittest.main()